@@ -3,24 +3,29 @@
 MySQL Backup & Cleanup Script:
 - Full DB backup first
 - Table-wise incremental backup (based on created column)
-- Deletes older rows after successful backup (in 1000-row batches)
-- Zips each SQL dump
-- Moves each ZIP immediately to ~/glidex_backup
+- Deletes older rows after successful backup (in 5000-row primary-key chunks)
+- Pipes each SQL dump through zstd straight into ~/glidex_backup (no temp .sql file)
 """
 
-import datetime as dt
 import logging
+import logging.handlers
+import os
+import queue
 import shutil
 import subprocess
 import sys
+import tempfile
 import time
 from pathlib import Path
-from typing import Dict
-import zipfile
-import tempfile
+from typing import Dict, Optional
 import paramiko
 import mysql.connector
 
+try:
+    import zstandard  # only needed when the zstd CLI is not installed
+except ImportError:
+    zstandard = None
+
 # ────────────────────── Configuration ──────────────────────
 DB_HOST = "10.0.7.212"
 DB_USER = "pg_user"
@@ -49,14 +54,61 @@ RETENTION: Dict[str, int] = {
 }
 
 DEFAULT_RETENTION_DAYS = 7
-BATCH_SIZE = 1000
-SLEEP_BETWEEN_BATCHES = 0.5  # seconds
+BATCH_SIZE = 5000
+PK_COLUMN = "id"  # primary key of every purged table; deletes walk it in keyset chunks
+# Purge throttling: every LAG_CHECK_EVERY ranges, read replication lag and back off only when
+# the replica is behind. GLIDEX_REPLICA_HOST points at the replica; without it the purge is
+# not throttled (a primary has no replication lag to report).
+REPLICA_HOST = os.environ.get("GLIDEX_REPLICA_HOST")
+LAG_CHECK_EVERY = 10
+LAG_THRESHOLD = 1  # seconds of lag tolerated before backing off
+LAG_BACKOFF = 0.05  # seconds slept per second of lag above LAG_THRESHOLD
+LOG_EVERY_BATCHES = 50  # purge progress is logged at INFO once per this many batches
+DUMP_JOBS = 4  # table dumps run concurrently on the DB host
+
+# --single-transaction dumps from a consistent InnoDB snapshot without table locks;
+# --quick streams rows instead of buffering whole tables in mysqldump's memory.
+MYSQLDUMP_OPTS = [
+    "--single-transaction",
+    "--quick",
+    "--skip-lock-tables",
+    "--net-buffer-length=16777216",
+]
+# Protocol compression only pays off on high-latency links to DB_HOST.
+DUMP_COMPRESS = os.environ.get("GLIDEX_DUMP_COMPRESS") == "1"
+
+# Used instead of mysqldump for table dumps when mydumper is installed. Remotely this only
+# applies to MYDUMPER_TABLES, the tables too large for a single-threaded mysqldump.
+MYDUMPER_TABLES = ["transaction_details_log"]
+MYDUMPER_ROWS = 500000  # rows per chunk; chunks of one table are dumped in parallel
+MYDUMPER_THREADS = 8
+
+ZSTD_LEVEL = 3
+ZSTD_CMD = ["zstd", "-T0", f"-{ZSTD_LEVEL}", "-q"]  # -T0: use all cores
+# On the DB host up to DUMP_JOBS + 1 zstd pipelines run next to mysqld, so each one gets an
+# equal share of the cores (at least one) and runs at lowered CPU priority instead of -T0.
+REMOTE_ZSTD_NICE = 10
+IO_BUFFER_SIZE = 1 << 20  # bytes per read/write wherever Python itself moves backup data
+
+# SSH-level zlib only helps on slow WAN links; the backup payload is already compressed.
+SSH_COMPRESS = os.environ.get("GLIDEX_SSH_COMPRESS") == "1"
+SSH_KEEPALIVE = 60  # seconds
+# The archive is pulled with the OpenSSH client when it is installed; these only size the
+# paramiko fallback channel (its defaults of a 2 MiB window / 32 KiB packets cap throughput).
+SSH_WINDOW_SIZE = 64 << 20  # bytes
+SSH_MAX_PACKET_SIZE = 128 << 10  # bytes; OpenSSH servers reject packets over 256 KiB
 
 # ────────────────────── Logging ──────────────────────
+# Records are only enqueued on the calling thread; log_listener writes them to
+# stderr from a background thread so the purge/dump loops never block on I/O.
+_log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+_console = logging.StreamHandler()
+_console.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s", datefmt="%Y-%m-%d %H:%M:%S"))
+log_listener = logging.handlers.QueueListener(_log_queue, _console)
 logging.basicConfig(
     level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
+    format="%(message)s",
+    handlers=[logging.handlers.QueueHandler(_log_queue)],
 )
 log = logging.getLogger(__name__)
 
@@ -66,129 +118,348 @@ log.info("🚀 Starting MySQL Backup & Cleanup Script")
 
 # ────────────────────── Helpers ──────────────────────
 def timetag() -> str:
-    return dt.datetime.now().strftime("%Y%m%d%H%M%S")
+    return time.strftime("%Y%m%d%H%M%S")
 
 
-def run_cmd(argv, output_file: Path) -> None:
-    """Run a shell command and redirect output to a file."""
-    log.info("Running command: %s", ' '.join(argv))
-    log.info("Output will be written to: %s", output_file)
-    with output_file.open("w") as f:
+def retention_cutoff(conn, days: int):
+    """Timestamp for `days` ago per the DB server's own clock and timezone, computed once."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT NOW() - INTERVAL %s DAY", (days,))
+    (cutoff,) = cursor.fetchone()
+    cursor.close()
+    return cutoff
+
+
+def quote_ident(name: str) -> str:
+    """Backtick-quote a MySQL identifier (table/column names cannot be bound as parameters)."""
+    return "`" + name.replace("`", "``") + "`"
+
+
+def dump_and_compress_inproc(argv, final_name: str) -> Path:
+    """Stream a command's stdout through python-zstandard into FINAL_DIR (fallback when the zstd CLI is missing)."""
+    out_path = FINAL_DIR / final_name
+    cmd_str = ' '.join(argv)
+    log.info("Running command: %s", cmd_str)
+    log.info("Compressing output in-process into: %s", out_path)
+    # stderr goes to a temp file for the same reason as in dump_and_compress: only stdout is
+    # read while compressing, so a full stderr pipe would block the dump forever.
+    with tempfile.TemporaryFile() as err_file:
+        with subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=err_file, bufsize=IO_BUFFER_SIZE) as proc:
+            try:
+                with out_path.open("wb") as dst:
+                    cctx = zstandard.ZstdCompressor(level=ZSTD_LEVEL, threads=-1)
+                    cctx.copy_stream(proc.stdout, dst, read_size=IO_BUFFER_SIZE, write_size=IO_BUFFER_SIZE)
+            except Exception:
+                proc.kill()
+                out_path.unlink(missing_ok=True)
+                raise
+        err_file.seek(0)
+        err = err_file.read()
+    if proc.returncode != 0:
+        out_path.unlink(missing_ok=True)
+        log.error("Command failed: %s", err.decode())
+        log.error("Failed command: %s", cmd_str)
+        raise subprocess.CalledProcessError(proc.returncode, argv, stderr=err)
+    log.debug("Command completed successfully: %s", cmd_str)
+    log.info("📦 Compressed → %s", out_path)
+    return out_path
+
+
+def dump_and_compress(argv, final_name: str) -> Path:
+    """Pipe a command's stdout through multi-threaded zstd straight into FINAL_DIR."""
+    if shutil.which(ZSTD_CMD[0]) is None:
+        if zstandard is None:
+            log.error("Cannot compress %s: install the zstd CLI or the zstandard package", final_name)
+            raise RuntimeError("Neither the zstd CLI nor the zstandard package is installed")
+        log.warning("%s not found, compressing %s with python-zstandard", ZSTD_CMD[0], final_name)
+        return dump_and_compress_inproc(argv, final_name)
+    out_path = FINAL_DIR / final_name
+    zstd_cmd = [*ZSTD_CMD, "-o", str(out_path)]
+    cmd_str = ' '.join(argv)
+    log.info("Running command: %s", cmd_str)
+    log.info("Compressing output into: %s", out_path)
+    # The dump's stderr goes to a temp file, not a pipe: nothing reads it until zstd is done,
+    # and a full stderr pipe would block the dump (and with it zstd) forever.
+    with tempfile.TemporaryFile() as err_file:
+        with subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=err_file) as proc:
+            zstd = subprocess.Popen(zstd_cmd, stdin=proc.stdout, stderr=subprocess.PIPE)
+            proc.stdout.close()  # zstd owns the read end now; lets the dump see SIGPIPE if zstd dies
+            _, zstd_err = zstd.communicate()
+        err_file.seek(0)
+        err = err_file.read()
+    for failed_cmd, returncode, stderr in ((argv, proc.returncode, err), (zstd_cmd, zstd.returncode, zstd_err)):
+        if returncode != 0:
+            out_path.unlink(missing_ok=True)
+            log.error("Command failed: %s", stderr.decode())
+            log.error("Failed command: %s", ' '.join(failed_cmd))
+            raise subprocess.CalledProcessError(returncode, failed_cmd, stderr=stderr)
+    log.debug("Command completed successfully: %s", cmd_str)
+    log.info("📦 Compressed → %s", out_path)
+    return out_path
+
+
+def dump_table_mydumper(table: str, where: str, stamp: str) -> Path:
+    """Dump one table with mydumper (parallel row-range chunks), then tar+zstd the chunk dir."""
+    out_dir = BACKUP_DIR / f"{table}_{stamp}"
+    cmd = [
+        "mydumper",
+        "--host", DB_HOST,
+        "--user", DB_USER,
+        "--password", DB_PASS,
+        "--database", DB_NAME,
+        "--tables-list", f"{DB_NAME}.{table}",
+        f"--where={where}",
+        f"--rows={MYDUMPER_ROWS}",
+        f"--threads={MYDUMPER_THREADS}",
+        "--trx-consistency-only",
+        "--outputdir", str(out_dir),
+    ]
+    if DUMP_COMPRESS:
+        cmd.append("--compress-protocol")
+    cmd_str = ' '.join(cmd)
+    log.info("Running command: %s", cmd_str)
+    try:
         try:
-            subprocess.run(argv, check=True, stdout=f, stderr=subprocess.PIPE)
-            log.info("Command completed successfully: %s", ' '.join(argv))
+            subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
         except subprocess.CalledProcessError as e:
             log.error("Command failed: %s", e.stderr.decode())
-            log.error("Failed command: %s", ' '.join(argv))
+            log.error("Failed command: %s", cmd_str)
             raise
-
-
-def zip_and_move(source_file: Path, final_name: str) -> Path:
-    log.info("Zipping and moving file: %s to %s", source_file, FINAL_DIR / final_name)
-    zip_path = FINAL_DIR / final_name
-    with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_DEFLATED) as zipf:
-        zipf.write(source_file, arcname=source_file.name)
-    source_file.unlink()
-    log.info("📦 Moved and zipped → %s", zip_path)
-    return zip_path
+        tar_cmd = ["tar", "-C", str(BACKUP_DIR), "-cf", "-", out_dir.name]
+        return dump_and_compress(tar_cmd, f"{table}_{stamp}.tar.zst")
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
 
 
 def dump_table(table: str, days: int, stamp: str) -> Path:
-    sql_file = BACKUP_DIR / f"{table}_{stamp}.sql"
-    where = f"created < DATE_SUB(NOW(), INTERVAL {days} DAY)"
+    where = f"created < NOW() - INTERVAL {int(days)} DAY"
+    if shutil.which("mydumper"):
+        log.info("Dumping table with mydumper: %s, days: %d", table, days)
+        out_path = dump_table_mydumper(table, where, stamp)
+        log.info("Table dump completed: %s", out_path)
+        return out_path
     cmd = [
         "mysqldump",
         "-h", DB_HOST,
         "-u", DB_USER,
         f"-p{DB_PASS}",
+        *MYSQLDUMP_OPTS,
         DB_NAME,
         table,
         f"--where={where}",
     ]
-    log.info("Dumping table: %s, days: %d, file: %s", table, days, sql_file)
-    run_cmd(cmd, sql_file)
-    log.info("Table dump completed: %s", sql_file)
-    return zip_and_move(sql_file, f"{table}_{stamp}.zip")
+    if DUMP_COMPRESS:
+        cmd.append("--compress")
+    log.info("Dumping table: %s, days: %d", table, days)
+    out_path = dump_and_compress(cmd, f"{table}_{stamp}.sql.zst")
+    log.info("Table dump completed: %s", out_path)
+    return out_path
 
 
 def dump_full_db(stamp: str) -> Path:
-    sql_file = BACKUP_DIR / f"{DB_NAME}_full_{stamp}.sql"
     cmd = [
         "mysqldump",
         "-h", DB_HOST,
         "-u", DB_USER,
         f"-p{DB_PASS}",
+        *MYSQLDUMP_OPTS,
         DB_NAME,
     ]
-    log.info("Starting full DB dump to: %s", sql_file)
-    run_cmd(cmd, sql_file)
-    log.info("Full DB dump completed: %s", sql_file)
-    return zip_and_move(sql_file, f"{DB_NAME}_full_{stamp}.zip")
+    if DUMP_COMPRESS:
+        cmd.append("--compress")
+    log.info("Starting full DB dump of: %s", DB_NAME)
+    out_path = dump_and_compress(cmd, f"{DB_NAME}_full_{stamp}.sql.zst")
+    log.info("Full DB dump completed: %s", out_path)
+    return out_path
 
 
-def purge_old_rows(table: str, days: int, conn) -> None:
-    """Delete old rows in batches of 1000."""
-    cursor = conn.cursor()
+class ReplicaLagProbe:
+    """Reads replication lag from a replica connection; turns itself off after the first failure."""
+
+    # Newer statement first (MySQL 8.0.22+, the only one left in 8.4), then the pre-8.0.22 one.
+    STATEMENTS = [
+        ("SHOW REPLICA STATUS", "Seconds_Behind_Source"),
+        ("SHOW SLAVE STATUS", "Seconds_Behind_Master"),
+    ]
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.statements = list(self.STATEMENTS)
+
+    def lag(self) -> int:
+        """Seconds the replica is behind (0 if it is not replicating, or once the probe is disabled)."""
+        while self.statements:
+            stmt, column = self.statements[0]
+            try:
+                cursor = self.conn.cursor(dictionary=True)
+                cursor.execute(stmt)
+                rows = cursor.fetchall()
+                cursor.close()
+            except mysql.connector.Error as e:
+                self.statements.pop(0)
+                if not self.statements:
+                    log.warning("Could not read replica lag, purging without throttling: %s", e)
+                continue
+            del self.statements[1:]  # stick with the statement this server understands
+            return max((row[column] or 0 for row in rows), default=0)
+        return 0
+
+
+def purge_old_rows(table: str, days: int, conn, lag_probe: Optional[ReplicaLagProbe] = None) -> None:
+    """Delete old rows in keyset chunks of BATCH_SIZE qualifying rows, backing off when replica lag grows."""
+    cutoff = retention_cutoff(conn, days)
+    table_sql, pk_sql = quote_ident(table), quote_ident(PK_COLUMN)
+    # Server-side prepared statements: the statements below are parsed once and only re-bound per chunk.
+    cursor = conn.cursor(prepared=True)
+    cursor.execute(f"SELECT MIN({pk_sql}), MAX({pk_sql}) FROM {table_sql} WHERE created < %s", (cutoff,))
+    low, high = cursor.fetchone()
+    conn.commit()
+    if low is None:
+        log.info("   ✓ Nothing to delete from %s (no rows before %s)", table, cutoff)
+        return
+    # The chunk's upper bound is the id of the BATCH_SIZE-th qualifying row after the last
+    # chunk, so every DELETE removes a full batch no matter how sparse the ids are. The
+    # DELETE re-checks `created`, keeping newer rows interleaved in the range.
+    bound_sql = (
+        f"SELECT {pk_sql} FROM {table_sql} WHERE {pk_sql} > %s AND created < %s "
+        f"ORDER BY {pk_sql} LIMIT 1 OFFSET {BATCH_SIZE - 1}"
+    )
+    delete_sql = f"DELETE FROM {table_sql} WHERE {pk_sql} > %s AND {pk_sql} <= %s AND created < %s"
+    last = low - 1
     total_deleted = 0
-    while True:
-        log.info("Purging rows from %s older than %d days", table, days)
-        cursor.execute(
-            f"DELETE FROM {table} WHERE created < DATE_SUB(NOW(), INTERVAL {days} DAY) LIMIT {BATCH_SIZE}"
-        )
+    batches = 0
+    debug = log.isEnabledFor(logging.DEBUG)  # checked once; the loop can run thousands of times
+    while last < high:
+        cursor.execute(bound_sql, (last, cutoff))
+        rows = cursor.fetchall()
+        upper = min(rows[0][0], high) if rows else high
+        if debug:
+            log.debug("Purging rows from %s with %s in (%d, %d] before %s", table, PK_COLUMN, last, upper, cutoff)
+        cursor.execute(delete_sql, (last, upper, cutoff))
         deleted = cursor.rowcount
         conn.commit()
-        if deleted == 0:
-            break
         total_deleted += deleted
-        log.info("   • Deleted %d rows from %s (total so far: %d)", deleted, table, total_deleted)
-        time.sleep(SLEEP_BETWEEN_BATCHES)
+        last = upper
+        batches += 1
+        if batches % LOG_EVERY_BATCHES == 0:
+            log.info("   • Deleted %d rows from %s so far", total_deleted, table)
+        elif debug:
+            log.debug("   • Deleted %d rows from %s (total so far: %d)", deleted, table, total_deleted)
+        if lag_probe is not None and batches % LAG_CHECK_EVERY == 0 and last < high:
+            lag = lag_probe.lag()
+            if lag > LAG_THRESHOLD:
+                log.info("   … replica is %ds behind, pausing purge of %s", lag, table)
+                time.sleep(LAG_BACKOFF * (lag - LAG_THRESHOLD))
     log.info("   ✓ Finished deleting from %s (%d rows total)", table, total_deleted)
 
 
-def run_remote_cmd_paramiko(ssh_key: Path, user_host: str, remote_cmd: str):
-    """Run a command on the remote server via SSH using paramiko."""
+class SSHSession:
+    """A single paramiko SSH connection reused for every remote step."""
+
+    def __init__(self, ssh_key: Path, user_host: str):
+        self.user_host = user_host
+        self.user, self.host = user_host.split('@')
+        self.ssh_key = ssh_key
+        self.key = paramiko.RSAKey.from_private_key_file(str(ssh_key))
+        self.client = None
+
+    def __enter__(self) -> "SSHSession":
+        log.info("[paramiko] Connecting to %s", self.user_host)
+        self.client = paramiko.SSHClient()
+        self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        try:
+            self.client.connect(hostname=self.host, username=self.user, pkey=self.key, compress=SSH_COMPRESS)
+            # The session stays open through the (possibly long) purge step.
+            self.client.get_transport().set_keepalive(SSH_KEEPALIVE)
+        except Exception:
+            self.client.close()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.client.close()
+
+    def exec(self, remote_cmd: str):
+        return self.client.exec_command(remote_cmd)
+
+
+def run_remote_cmd_paramiko(session: SSHSession, remote_cmd: str, stdin_data: Optional[str] = None):
+    """Run a command on the remote server over an open SSH session, optionally feeding it stdin."""
     log.info("[paramiko] Running remote command: %s", remote_cmd)
-    user, host = user_host.split('@')
-    key = paramiko.RSAKey.from_private_key_file(str(ssh_key))
-    ssh = paramiko.SSHClient()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    stdin, stdout, stderr = session.exec(remote_cmd)
+    if stdin_data is not None:
+        stdin.write(stdin_data)
+        stdin.channel.shutdown_write()
+    out = stdout.read().decode()
+    err = stderr.read().decode()
+    if out:
+        log.info("[paramiko] STDOUT: %s", out.strip())
+    if err:
+        log.error("[paramiko] STDERR: %s", err.strip())
+    exit_status = stdout.channel.recv_exit_status()
+    if exit_status != 0:
+        log.error("[paramiko] Remote command failed with exit status %d", exit_status)
+        raise Exception(f"Remote command failed: {err}")
+    else:
+        log.info("[paramiko] Remote command completed successfully.")
+
+
+def stream_from_remote_openssh(session: SSHSession, remote_cmd: str, local_path: Path):
+    """Run a command on the remote server via the ssh CLI and stream its stdout straight into a local file."""
+    ssh_cmd = ["ssh", "-i", str(session.ssh_key), "-o", "BatchMode=yes", "-o", "StrictHostKeyChecking=accept-new",
+               session.user_host, remote_cmd]
+    log.info("[ssh] Streaming output of remote command: %s to local: %s", remote_cmd, local_path)
+    with tempfile.TemporaryFile() as err_file:
+        try:
+            with local_path.open("wb", buffering=IO_BUFFER_SIZE) as f:
+                result = subprocess.run(ssh_cmd, stdout=f, stderr=err_file)
+        except Exception as e:
+            local_path.unlink(missing_ok=True)
+            log.error("[ssh] Streaming failed: %s", e)
+            raise
+        err_file.seek(0)
+        err = err_file.read()
+    if result.returncode != 0:
+        local_path.unlink(missing_ok=True)
+        log.error("[ssh] Remote command failed with exit status %d: %s", result.returncode, err.decode().strip())
+        raise subprocess.CalledProcessError(result.returncode, ssh_cmd, stderr=err)
+    log.info("[ssh] Stream completed.")
+
+
+def stream_from_remote_paramiko(session: SSHSession, remote_cmd: str, local_path: Path):
+    """Same as stream_from_remote_openssh, over a widened paramiko channel (fallback when ssh is missing)."""
+    log.info("[paramiko] Streaming output of remote command: %s to local: %s", remote_cmd, local_path)
+    channel = session.client.get_transport().open_session(
+        window_size=SSH_WINDOW_SIZE, max_packet_size=SSH_MAX_PACKET_SIZE)
     try:
-        ssh.connect(hostname=host, username=user, pkey=key)
-        stdin, stdout, stderr = ssh.exec_command(remote_cmd)
-        out = stdout.read().decode()
+        channel.exec_command(remote_cmd)
+        channel.shutdown_write()
+        stdout = channel.makefile("rb", IO_BUFFER_SIZE)
+        stderr = channel.makefile_stderr("rb")
+        try:
+            with local_path.open("wb", buffering=IO_BUFFER_SIZE) as f:
+                shutil.copyfileobj(stdout, f, IO_BUFFER_SIZE)
+        except Exception as e:
+            local_path.unlink(missing_ok=True)
+            log.error("[paramiko] Streaming failed: %s", e)
+            raise
         err = stderr.read().decode()
-        if out:
-            log.info("[paramiko] STDOUT: %s", out.strip())
-        if err:
-            log.error("[paramiko] STDERR: %s", err.strip())
-        exit_status = stdout.channel.recv_exit_status()
-        if exit_status != 0:
-            log.error("[paramiko] Remote command failed with exit status %d", exit_status)
-            raise Exception(f"Remote command failed: {err}")
-        else:
-            log.info("[paramiko] Remote command completed successfully.")
+        exit_status = channel.recv_exit_status()
     finally:
-        ssh.close()
+        channel.close()
+    if exit_status != 0:
+        local_path.unlink(missing_ok=True)
+        log.error("[paramiko] Remote command failed with exit status %d: %s", exit_status, err.strip())
+        raise Exception(f"Remote command failed: {err}")
+    log.info("[paramiko] Stream completed.")
 
 
-def scp_from_remote_paramiko(ssh_key: Path, user_host: str, remote_path: str, local_path: Path):
-    """Copy file from remote server to local via paramiko SFTP."""
-    log.info("[paramiko] Copying from remote: %s:%s to local: %s", user_host, remote_path, local_path)
-    user, host = user_host.split('@')
-    key = paramiko.RSAKey.from_private_key_file(str(ssh_key))
-    ssh = paramiko.SSHClient()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    try:
-        ssh.connect(hostname=host, username=user, pkey=key)
-        sftp = ssh.open_sftp()
-        sftp.get(remote_path, str(local_path))
-        log.info("[paramiko] SFTP get completed.")
-        sftp.close()
-    except Exception as e:
-        log.error("[paramiko] SFTP get failed: %s", e)
-        raise
-    finally:
-        ssh.close()
+def stream_from_remote(session: SSHSession, remote_cmd: str, local_path: Path):
+    """Stream a remote command's stdout into a local file, preferring the OpenSSH client over paramiko."""
+    if shutil.which("ssh") is None:
+        log.warning("ssh not found, streaming %s over paramiko", local_path.name)
+        return stream_from_remote_paramiko(session, remote_cmd, local_path)
+    return stream_from_remote_openssh(session, remote_cmd, local_path)
 
 
 # ────────────────────── Main Workflow ──────────────────────
@@ -201,99 +472,120 @@ def main():
     SSH_KEY = Path("Glidex-DB.pem")
     USER_HOST = "ubuntu@10.0.7.212"
     REMOTE_BACKUP_DIR = f"/home/ubuntu/backup_{stamp}"
-    REMOTE_ZIP = f"/home/ubuntu/backup_{stamp}.zip"
-    REMOTE_SCRIPT_PATH = f"/home/ubuntu/backup_script_{stamp}.sh"
 
-    # 1. Prepare remote backup script (use localhost for DB_HOST)
+    # 1. Prepare remote backup script (use localhost for DB_HOST).
+    #    The full dump runs in the background while xargs keeps DUMP_JOBS table dumps going.
+    #    Each dump is piped through zstd as it is produced, so compression overlaps the dump
+    #    instead of running as a separate pass over the finished .sql files.
+    #    If mydumper is installed there, MYDUMPER_TABLES are dumped with it instead (parallel
+    #    row-range chunks) and each chunk dir is tarred through zstd into the backup dir.
+    #    If any table dump fails, the EXIT trap kills the still-running full dump pipeline so its
+    #    mysqldump does not keep a snapshot open on production after we report failure.
+    dump_opts = ' '.join(MYSQLDUMP_OPTS)
+    zstd_cmd = f"nice -n {REMOTE_ZSTD_NICE} zstd -T$zstd_threads -{ZSTD_LEVEL} -q"
+    big_tables = [t for t in TABLES if t in MYDUMPER_TABLES]
+    other_tables = [t for t in TABLES if t not in MYDUMPER_TABLES]
     remote_script = f'''
-set -e
+set -e -o pipefail
 mkdir -p {REMOTE_BACKUP_DIR}
-mysqldump -h localhost -u {DB_USER} -p'{DB_PASS}' {DB_NAME} > {REMOTE_BACKUP_DIR}/{DB_NAME}_full_{stamp}.sql
+zstd_threads=$(( $(nproc) / {DUMP_JOBS + 1} ))
+[ "$zstd_threads" -ge 1 ] || zstd_threads=1
+mysqldump -h localhost -u {DB_USER} -p'{DB_PASS}' {dump_opts} {DB_NAME} | {zstd_cmd} -o {REMOTE_BACKUP_DIR}/{DB_NAME}_full_{stamp}.sql.zst &
+full_dump_pid=$!
+trap 'rc=$?; pkill -P $$ 2>/dev/null || true; exit $rc' EXIT
+tables="{' '.join(TABLES)}"
+big_tables=""
+if command -v mydumper >/dev/null 2>&1; then
+  tables="{' '.join(other_tables)}"
+  big_tables="{' '.join(big_tables)}"
+fi
+printf '%s\\n' $tables | xargs -P {DUMP_JOBS} -I{{}} bash -o pipefail -c "mysqldump -h localhost -u {DB_USER} -p'{DB_PASS}' {dump_opts} {DB_NAME} {{}} | {zstd_cmd} -o {REMOTE_BACKUP_DIR}/{{}}_{stamp}.sql.zst"
+for t in $big_tables; do
+  mydumper --host localhost --user {DB_USER} --password '{DB_PASS}' --database {DB_NAME} --tables-list {DB_NAME}.$t --rows={MYDUMPER_ROWS} --threads={MYDUMPER_THREADS} --trx-consistency-only --outputdir {REMOTE_BACKUP_DIR}/${{t}}_{stamp}
+  tar -C {REMOTE_BACKUP_DIR} -cf - ${{t}}_{stamp} | {zstd_cmd} -o {REMOTE_BACKUP_DIR}/${{t}}_{stamp}.tar.zst
+  rm -rf {REMOTE_BACKUP_DIR}/${{t}}_{stamp}
+done
+wait $full_dump_pid
 '''
-    for table in TABLES:
-        remote_script += f"mysqldump -h localhost -u {DB_USER} -p'{DB_PASS}' {DB_NAME} {table} > {REMOTE_BACKUP_DIR}/{table}_{stamp}.sql\n"
-    remote_script += f"cd /home/ubuntu && zip -r backup_{stamp}.zip backup_{stamp}\n"
-
-    # 2. Write remote script to temp file
-    with tempfile.NamedTemporaryFile("w", delete=False, suffix=".sh") as tf:
-        tf.write(remote_script)
-        tf.flush()
-        local_script_path = tf.name
-
-    # 3. Copy script to remote home dir using paramiko SFTP
-    log.info("[paramiko] Copying backup script to remote: %s", REMOTE_SCRIPT_PATH)
-    user, host = USER_HOST.split('@')
-    key = paramiko.RSAKey.from_private_key_file(str(SSH_KEY))
-    ssh = paramiko.SSHClient()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    try:
-        ssh.connect(hostname=host, username=user, pkey=key)
-        sftp = ssh.open_sftp()
-        sftp.put(local_script_path, REMOTE_SCRIPT_PATH)
-        log.info("[paramiko] Script copied to remote.")
-        sftp.close()
-    except Exception as e:
-        log.error("[paramiko] SFTP put failed: %s", e)
-        raise
-    finally:
-        ssh.close()
-
-    log.info("Script copied via paramiko. Running on remote...")
-
-    backup_success = False
-    try:
-        # 4. Run script on remote
-        run_remote_cmd_paramiko(SSH_KEY, USER_HOST, f"bash {REMOTE_SCRIPT_PATH}")
-        backup_success = True
-    except Exception as e:
-        log.error("Remote backup script failed, aborting: %s", e)
-
-    if not backup_success:
-        log.error("Backup failed, skipping download and cleanup. Data will NOT be deleted on remote.")
-        return
-
-    # 5. Pull the zip file here
-    try:
-        scp_from_remote_paramiko(SSH_KEY, USER_HOST, REMOTE_ZIP, FINAL_DIR / f"backup_{stamp}.zip")
-        log.info("Pulled backup zip from remote.")
-    except Exception as e:
-        log.error("Failed to pull backup zip from remote: %s", e)
-        log.error("Backup zip not pulled, skipping cleanup. Data will NOT be deleted on remote.")
-        return
 
-    # 6. After successful  backup and download, purge old rows locally in batches
-    try:
-        log.info("Connecting to MySQL for purge on %s as %s", DB_HOST, DB_USER)
-        conn = mysql.connector.connect(
-            host=DB_HOST,
-            user=DB_USER,
-            password=DB_PASS,
-            database=DB_NAME,
-            autocommit=False
-        )
-        for table in TABLES:
-            retention_days = RETENTION.get(table, DEFAULT_RETENTION_DAYS)
-            try:
-                log.info("Purging old rows from '%s' older than %d days...", table, retention_days)
-                purge_old_rows(table, retention_days, conn)
-            except Exception as e:
-                log.error("Failed to purge table '%s': %s", table, e)
-        conn.close()
-        log.info("All eligible old rows purged after successful backup.")
-    except Exception as e:
-        log.error("Failed to connect or purge rows after backup: %s", e)
-        log.error("Manual cleanup may be required.")
-
-    # 7. Remove remote files after successful pull
-    try:
-        log.info("Cleaning up remote backup files...")
-        cleanup_cmd = f"rm -rf {REMOTE_BACKUP_DIR} {REMOTE_ZIP} {REMOTE_SCRIPT_PATH}"
-        run_remote_cmd_paramiko(SSH_KEY, USER_HOST, cleanup_cmd)
-        log.info("Remote backup files cleaned up.")
-    except Exception as e:
-        log.error("Failed to clean up remote files: %s", e)
-        log.error("Manual cleanup may be required on remote host.")
+    with SSHSession(SSH_KEY, USER_HOST) as session:
+        backup_success = False
+        try:
+            # 2. Run script on remote, fed over the exec channel (no temp file or SFTP upload)
+            run_remote_cmd_paramiko(session, "bash -s", stdin_data=remote_script)
+            backup_success = True
+        except Exception as e:
+            log.error("Remote backup script failed, aborting: %s", e)
+
+        if not backup_success:
+            log.error("Backup failed, skipping download and cleanup. Data will NOT be deleted on remote.")
+            return
+
+        # 3. Stream the dump directory here as a tar over the SSH channel. The dumps are
+        #    already zstd-compressed, so nothing is archived or re-compressed on the remote disk.
+        try:
+            tar_cmd = f"tar -C /home/ubuntu -cf - backup_{stamp}"
+            stream_from_remote(session, tar_cmd, FINAL_DIR / f"backup_{stamp}.tar")
+            log.info("Pulled backup archive from remote.")
+        except Exception as e:
+            log.error("Failed to pull backup archive from remote: %s", e)
+            log.error("Backup archive not pulled, skipping cleanup. Data will NOT be deleted on remote.")
+            return
+
+        # 4. After successful  backup and download, purge old rows locally in batches
+        conn = lag_conn = lag_probe = None
+        try:
+            log.info("Connecting to MySQL for purge on %s as %s", DB_HOST, DB_USER)
+            conn = mysql.connector.connect(
+                host=DB_HOST,
+                user=DB_USER,
+                password=DB_PASS,
+                database=DB_NAME,
+                autocommit=False,
+                use_pure=False,  # C extension; the pure-Python protocol is much slower in the purge loop
+            )
+            if REPLICA_HOST:
+                log.info("Watching replication lag on %s while purging", REPLICA_HOST)
+                try:
+                    lag_conn = mysql.connector.connect(
+                        host=REPLICA_HOST,
+                        user=DB_USER,
+                        password=DB_PASS,
+                        use_pure=False,
+                    )
+                    lag_probe = ReplicaLagProbe(lag_conn)
+                except mysql.connector.Error as e:
+                    log.warning("Could not connect to replica %s, purging without throttling: %s", REPLICA_HOST, e)
+            for table in TABLES:
+                retention_days = RETENTION.get(table, DEFAULT_RETENTION_DAYS)
+                try:
+                    log.info("Purging old rows from '%s' older than %d days...", table, retention_days)
+                    purge_old_rows(table, retention_days, conn, lag_probe)
+                except Exception as e:
+                    log.error("Failed to purge table '%s': %s", table, e)
+            log.info("All eligible old rows purged after successful backup.")
+        except Exception as e:
+            log.error("Failed to connect or purge rows after backup: %s", e)
+            log.error("Manual cleanup may be required.")
+        finally:
+            for c in (lag_conn, conn):
+                if c is not None:
+                    c.close()
+
+        # 5. Remove remote files after successful pull
+        try:
+            log.info("Cleaning up remote backup files...")
+            cleanup_cmd = f"rm -rf {REMOTE_BACKUP_DIR}"
+            run_remote_cmd_paramiko(session, cleanup_cmd)
+            log.info("Remote backup files cleaned up.")
+        except Exception as e:
+            log.error("Failed to clean up remote files: %s", e)
+            log.error("Manual cleanup may be required on remote host.")
 
 
 if __name__ == "__main__":
-    main()
+    log_listener.start()
+    try:
+        main()
+    finally:
+        log_listener.stop()